@@ -1,10 +1,11 @@
 import pandas as pd
 import utm
-from functools import partial, wraps
+from functools import wraps
+from hashlib import blake2b
 from inspect import signature
 from invisibleroads_macros.disk import (
     TemporaryStorage, compress, compress_zip, find_paths, get_file_stem,
-    has_archive_extension, move_path, replace_file_extension)
+    has_archive_extension, prepare_path, replace_file_extension)
 from invisibleroads_macros import geometry
 from invisibleroads_macros.html import make_random_color
 from invisibleroads_macros.table import load_csv_safely
@@ -12,22 +13,31 @@ from invisibleroads_macros.text import unicode_safely
 from os.path import join
 from osgeo import gdal, ogr, osr
 from shapely.geometry import GeometryCollection, box
+from shapely.prepared import prep
 
-from .exceptions import EmptyGeoTableError, GeoTableError
+from .exceptions import (
+    CoordinateTransformationError, EmptyGeoTableError, GeoTableError,
+    SpatialReferenceError)
 from .macros import (
+    _drop_columns,
     _ensure_geotable_columns,
+    _get_file_key,
     _get_geometry_columns,
+    _get_geometry_wkbs,
+    _get_groups,
     _get_instance_for_csv,
     _get_instance_from_gdal_layer,
-    _get_load_geometry_object,
+    _get_load_geometry_objects,
     _get_proj4_from_gdal_layer,
     _get_proj4_from_path,
     _get_source_folder,
+    _get_vsicurl_path,
     _prepare_gdal_layer,
     _has_one_proj4,
     _make_geotable)
 from .projections import (
     _get_transform_gdal_geometry,
+    get_transform_shapely_geometries,
     get_transform_shapely_geometry,
     get_utm_proj4,
     normalize_proj4,
@@ -35,9 +45,10 @@ from .projections import (
     SPHERICAL_MERCATOR_PROJ4)
 
 
-KML_COLUMNS = [
+KML_COLUMNS = frozenset([
     'description', 'timestamp', 'begin', 'end', 'altitudeMode', 'tessellate',
-    'extrude', 'visibility', 'drawOrder', 'icon', 'snippet']
+    'extrude', 'visibility', 'drawOrder', 'icon', 'snippet'])
+UTM_PROJ4_PACK_BY_PATH = {}
 GEOTABLE_EXTENSIONS = [
     '.csv',
     '.geojson',
@@ -66,10 +77,31 @@ class GeoTable(pd.DataFrame):
 
     @classmethod
     def load_utm_proj4(Class, source_path_or_url):
+        # Reuse the zone computed for a local file until the file changes
+        file_key = _get_file_key(source_path_or_url)
+        if file_key:
+            source_path = file_key[0]
+            cached_key, utm_proj4 = UTM_PROJ4_PACK_BY_PATH.get(
+                source_path, (None, None))
+            if cached_key == file_key:
+                return utm_proj4
+        utm_proj4 = Class._load_utm_proj4(source_path_or_url)
+        if file_key:
+            UTM_PROJ4_PACK_BY_PATH[source_path] = file_key, utm_proj4
+        return utm_proj4
+
+    @classmethod
+    def _load_utm_proj4(Class, source_path_or_url):
         geotable = Class.load(
             source_path_or_url, target_proj4=LONGITUDE_LATITUDE_PROJ4)
-        lonlat_point = GeometryCollection(geotable.geometries).centroid
-        longitude, latitude = lonlat_point.x, lonlat_point.y
+        lonlat_points = [
+            g.centroid for g in geotable.geometries
+            if g is not None and not g.is_empty]
+        if not lonlat_points:
+            raise GeoTableError(
+                'geometries expected (%s)' % source_path_or_url)
+        longitude = sum(p.x for p in lonlat_points) / len(lonlat_points)
+        latitude = sum(p.y for p in lonlat_points) / len(lonlat_points)
         zone_number, zone_letter = utm.from_latlon(latitude, longitude)[-2:]
         return get_utm_proj4(zone_number, zone_letter)
 
@@ -93,8 +125,9 @@ class GeoTable(pd.DataFrame):
                 LONGITUDE_LATITUDE_PROJ4, target_proj4)
             bounding_polygon = f(box(*bounding_box))
         if bounding_polygon:
-            indices = [i for i, g in enumerate(t.geometries) if g.intersects(
-                bounding_polygon)]
+            prepared_polygon = prep(bounding_polygon)
+            indices = [i for i, g in enumerate(
+                t.geometries) if prepared_polygon.intersects(g)]
             t = t.iloc[indices].copy()
         return t
 
@@ -105,6 +138,16 @@ class GeoTable(pd.DataFrame):
             source_proj4=None,
             target_proj4=None,
             **kw):
+        vsicurl_path = _get_vsicurl_path(source_path_or_url)
+        if vsicurl_path:
+            # Let gdal stream the url instead of saving it to disk first
+            try:
+                return Class.from_gdal(
+                    vsicurl_path, source_proj4, target_proj4)
+            except (CoordinateTransformationError, SpatialReferenceError):
+                raise
+            except (GeoTableError, RuntimeError, ValueError):
+                pass
         with TemporaryStorage() as storage:
             try:
                 source_folder = _get_source_folder(
@@ -135,11 +178,19 @@ class GeoTable(pd.DataFrame):
         return Class()
 
     def drop_duplicate_geometries(self, inplace=False):
-        t = self if inplace else self.copy()
-        t['geometry_wkb'] = [g.wkb for g in t.geometries]
-        t.drop_duplicates(subset=['geometry_wkb'], inplace=True)
-        t.drop(columns=['geometry_wkb'], inplace=True)
-        return t
+        # Compare fixed-size digests instead of whole wkb strings
+        geometry_keys = pd.Series([blake2b(
+            x, digest_size=16).digest() for x in _get_geometry_wkbs(
+                self.geometries)])
+        is_duplicate = geometry_keys.duplicated().values
+        if not inplace:
+            return self[~is_duplicate].copy()
+        # Drop by position so that repeated index labels are kept apart
+        index = self.index
+        self.index = range(len(self))
+        self.drop(self.index[is_duplicate], inplace=True)
+        self.index = index[~is_duplicate]
+        return self
 
     @classmethod
     def from_records(Class, *args, **kw):
@@ -148,23 +199,42 @@ class GeoTable(pd.DataFrame):
 
     @classmethod
     def from_gdal(Class, source_path, source_proj4=None, target_proj4=None):
+        instances = list(Class.iter_from_gdal(
+            source_path, source_proj4, target_proj4))
+        return concatenate_tables(instances)
+
+    @classmethod
+    def iter_from_gdal(
+            Class, source_path, source_proj4=None, target_proj4=None,
+            chunk_size=None):
         try:
             gdal_dataset = gdal.OpenEx(source_path)
         except RuntimeError:
             raise GeoTableError('file unloadable (%s)' % source_path)
-        instances = []
+        is_kml = source_path.endswith('.kmz') or source_path.endswith('.kml')
         for layer_index in range(gdal_dataset.GetLayerCount()):
             gdal_layer = gdal_dataset.GetLayer(layer_index)
             row_proj4 = _get_proj4_from_gdal_layer(gdal_layer, source_proj4)
             f = _get_transform_gdal_geometry(row_proj4, target_proj4)
-            t = _get_instance_from_gdal_layer(Class, gdal_layer, f)
-            t['geometry_layer'] = unicode_safely(gdal_layer.GetName())
-            t['geometry_proj4'] = normalize_proj4(target_proj4 or row_proj4)
-            instances.append(t)
-        t = concatenate_tables(instances)
-        if source_path.endswith('.kmz') or source_path.endswith('.kml'):
-            t = t.drop(columns=KML_COLUMNS, errors='ignore')
-        return t
+            layer_name = unicode_safely(gdal_layer.GetName())
+            layer_proj4 = normalize_proj4(target_proj4 or row_proj4)
+            gdal_layer.ResetReading()
+            if chunk_size:
+                feature_count = gdal_layer.GetFeatureCount()
+                chunk_counts = [
+                    min(chunk_size, feature_count - x)
+                    for x in range(0, feature_count, chunk_size)] or [0]
+            else:
+                # Skip GetFeatureCount, which scans the file for some drivers
+                chunk_counts = [None]
+            for chunk_count in chunk_counts:
+                t = _get_instance_from_gdal_layer(
+                    Class, gdal_layer, f, chunk_count)
+                t['geometry_layer'] = layer_name
+                t['geometry_proj4'] = layer_proj4
+                if is_kml:
+                    t = _drop_columns(t, KML_COLUMNS)
+                yield t
 
     @classmethod
     def from_csv(
@@ -177,28 +247,31 @@ class GeoTable(pd.DataFrame):
             geometry_columns = _get_geometry_columns(t)
         except GeoTableError as e:
             raise GeoTableError(str(e) + ' (%s)' % source_path)
-        load_geometry_object = _get_load_geometry_object(geometry_columns)
+        load_geometry_objects = _get_load_geometry_objects(geometry_columns)
         source_proj4 = _get_proj4_from_path(source_path, source_proj4)
-        geometry_objects = []
+        geometry_objects = load_geometry_objects(t)
         if 'geometry_layer' not in t:
             t['geometry_layer'] = unicode_safely(get_file_stem(source_path))
         if _has_one_proj4(t):
-            row_proj4 = t.iloc[0].get('geometry_proj4', source_proj4)
-            f = get_transform_shapely_geometry(row_proj4, target_proj4)
-            for index, row in t.iterrows():
-                geometry_objects.append(f(load_geometry_object(row)))
+            row_proj4 = t['geometry_proj4'].iat[
+                0] if 'geometry_proj4' in t else source_proj4
+            f = get_transform_shapely_geometries(row_proj4, target_proj4)
+            geometry_objects = f(geometry_objects)
             t['geometry_proj4'] = normalize_proj4(target_proj4 or row_proj4)
         else:
-            geometry_proj4s = []
-            for index, row in t.iterrows():
-                row_proj4 = row.get('geometry_proj4', source_proj4)
-                f = get_transform_shapely_geometry(row_proj4, target_proj4)
-                geometry_objects.append(f(load_geometry_object(row)))
-                geometry_proj4s.append(normalize_proj4(
-                    target_proj4 or row_proj4))
+            geometry_proj4s = [None] * len(t)
+            indices_by_proj4 = t.groupby(
+                'geometry_proj4', sort=False).indices if len(t) else {}
+            for row_proj4, indices in indices_by_proj4.items():
+                f = get_transform_shapely_geometries(row_proj4, target_proj4)
+                geometry_proj4 = normalize_proj4(target_proj4 or row_proj4)
+                for index, geometry_object in zip(indices, f(
+                        geometry_objects[x] for x in indices)):
+                    geometry_objects[index] = geometry_object
+                    geometry_proj4s[index] = geometry_proj4
             t['geometry_proj4'] = geometry_proj4s
         t['geometry_object'] = geometry_objects
-        return Class(t.drop(geometry_columns, axis=1))
+        return Class(_drop_columns(t, geometry_columns))
 
     def save_geojson(self, target_path, target_proj4=None):
         self.to_geojson(target_path, target_proj4)
@@ -241,12 +314,7 @@ class GeoTable(pd.DataFrame):
 
     @_ensure_geotable_columns
     def to_csv(self, target_path, target_proj4=None, **kw):
-        try:
-            t = concatenate_tables(_get_instance_for_csv(
-                x, source_proj4 or LONGITUDE_LATITUDE_PROJ4, target_proj4,
-            ) for source_proj4, x in self.groupby('geometry_proj4'))
-        except ValueError:
-            t = self
+        t = _get_instance_for_csv(self, target_proj4)
 
         excluded_column_names = []
         unique_geometry_layers = t['geometry_layer'].unique()
@@ -257,25 +325,26 @@ class GeoTable(pd.DataFrame):
             excluded_column_names.append('geometry_proj4')
             geometry_proj4 = unique_geometry_proj4s[0]
             if geometry_proj4 != LONGITUDE_LATITUDE_PROJ4:
-                open(replace_file_extension(
-                    target_path, '.proj4'), 'wt').write(geometry_proj4)
+                with open(replace_file_extension(
+                        target_path, '.proj4'), 'wt') as proj4_file:
+                    proj4_file.write(geometry_proj4)
         if len(t) == 0:
             excluded_column_names.extend([
                 'geometry_layer',
                 'geometry_proj4',
                 'geometry_object'])
             t['wkt'] = ''
-        t = t.drop(columns=excluded_column_names)
+        t = _drop_columns(t, excluded_column_names)
         if len(t.columns) == 1:
             t[''] = ''
 
+        if not has_archive_extension(target_path):
+            super(GeoTable, t).to_csv(prepare_path(target_path), **kw)
+            return
         with TemporaryStorage() as storage:
             temporary_path = join(storage.folder, 'geotable.csv')
             super(GeoTable, t).to_csv(temporary_path, **kw)
-            if has_archive_extension(target_path):
-                compress(storage.folder, target_path)
-            else:
-                move_path(target_path, temporary_path)
+            compress(storage.folder, target_path)
 
     @_ensure_geotable_columns
     def to_gdal(
@@ -289,7 +358,7 @@ class GeoTable(pd.DataFrame):
         except GeoTableError:
             table = self
         else:
-            table = self.drop(columns=geometry_columns)
+            table = _drop_columns(self, geometry_columns)
         as_archive = has_archive_extension(target_path)
         as_kmz = target_path.endswith('.kmz')
         with TemporaryStorage() as storage:
@@ -301,7 +370,7 @@ class GeoTable(pd.DataFrame):
             else:
                 gdal_dataset_path = target_path
             gdal_dataset = gdal_driver.Create(gdal_dataset_path, 0, 0)
-            for layer_name, layer_t in table.groupby('geometry_layer'):
+            for layer_name, layer_t in _get_groups(table, 'geometry_layer'):
                 _prepare_gdal_layer(
                     layer_t, gdal_dataset, target_proj4, layer_name)
             gdal_dataset.FlushCache()
@@ -315,16 +384,22 @@ class GeoTable(pd.DataFrame):
         'Render layers in Jupyter Notebook'
         return ColorfulGeometryCollection([GeometryCollection(
             x.get_geometries(SPHERICAL_MERCATOR_PROJ4)
-        ) for _, x in self.groupby('geometry_layer')])
+        ) for _, x in self.groupby('geometry_layer', sort=False)])
 
     @_ensure_geotable_columns
     def get_geometries(self, target_proj4=None):
-        geometry_by_index = {}
-        for source_proj4, proj4_t in self.groupby('geometry_proj4'):
-            f = get_transform_shapely_geometry(source_proj4, target_proj4)
-            for index, row in proj4_t.iterrows():
-                geometry_by_index[index] = f(row['geometry_object'])
-        return list(pd.Series(geometry_by_index)[self.index])
+        geometry_objects = self['geometry_object'].values
+        indices_by_proj4 = self.groupby('geometry_proj4', sort=False).indices
+        if len(indices_by_proj4) == 1:
+            [source_proj4] = indices_by_proj4
+            f = get_transform_shapely_geometries(source_proj4, target_proj4)
+            return f(geometry_objects)
+        geometries = [None] * len(self)
+        for source_proj4, indices in indices_by_proj4.items():
+            f = get_transform_shapely_geometries(source_proj4, target_proj4)
+            for index, geometry in zip(indices, f(geometry_objects[indices])):
+                geometries[index] = geometry
+        return geometries
 
     @property
     def field_names(self):
@@ -369,14 +444,32 @@ class ColorfulGeometryCollection(GeometryCollection):
 
     def __init__(self, geoms=None, colors=None):
         super(ColorfulGeometryCollection, self).__init__(geoms)
-        self.colors = colors or [make_random_color() for x in range(len(
-            geoms or []))]
+        self._colors = colors
+        self._svg_by_key = {}
+
+    @property
+    def colors(self):
+        if not self._colors:
+            self._colors = [make_random_color() for x in range(len(
+                self.geoms))]
+        return self._colors
+
+    @colors.setter
+    def colors(self, colors):
+        self._colors = colors
 
     def svg(self, scale_factor=1.0, color=None):
         if self.is_empty:
             return '<g />'
-        return '<g>%s</g>' % ''.join(p.svg(scale_factor, c) for p, c in zip(
-            self, self.colors))
+        svg_key = scale_factor, tuple(self.colors)
+        try:
+            return self._svg_by_key[svg_key]
+        except KeyError:
+            pass
+        svg = '<g>%s</g>' % ''.join(p.svg(scale_factor, c) for p, c in zip(
+            self.geoms, self.colors))
+        self._svg_by_key[svg_key] = svg
+        return svg
 
 
 def define_load_with_utm_proj4(source_path):
@@ -405,7 +498,13 @@ def load(
         **kw)
 
 
-concatenate_tables = partial(pd.concat, ignore_index=True, sort=False)
+def concatenate_tables(tables, ignore_index=True, sort=False, **kw):
+    tables = list(tables)
+    if len(tables) == 1:
+        # Skip concat but still return a new table as concat would
+        table = tables[0]
+        return table.reset_index(drop=True) if ignore_index else table.copy()
+    return pd.concat(tables, ignore_index=ignore_index, sort=sort, **kw)
 
 
 gdal.SetConfigOption('GDAL_NUM_THREADS', 'ALL_CPUS')
@@ -1,25 +1,35 @@
 import inspect
+import numpy as np
+import re
 from collections import OrderedDict
 from datetime import datetime
 from functools import wraps
+from itertools import count, repeat
+from operator import methodcaller
 from invisibleroads_macros.disk import (
     get_file_stem, link_safely, make_unique_folder, make_unique_path,
     replace_file_extension, uncompress, ARCHIVE_EXTENSIONS)
 from invisibleroads_macros.exceptions import BadArchive, BadFormat
-from invisibleroads_macros.geometry import flip_xy, transform_geometries
+from invisibleroads_macros.geometry import flip_xy
 from invisibleroads_macros.log import get_log
 from invisibleroads_macros.text import unicode_safely
-from os.path import basename, exists, isdir, join, splitext
+from os import stat
+from os.path import abspath, basename, exists, isdir, join, splitext
 from osgeo import ogr
-from shapely import geometry, wkb, wkt
+from pandas import CategoricalDtype, DatetimeTZDtype, isnull
+from shapely import geometry, ops
 from shapely.errors import WKBReadingError, WKTReadingError
+from shapely.geos import (
+    WKBReader, WKBWriter, WKTReader, WKTWriter, lgeos)
+from stat import S_ISREG
 from urllib.parse import urlsplit as split_url
 from urllib.request import urlretrieve
 
 from .exceptions import GeoTableError
 from .projections import (
+    _get_load_gdal_geometries,
     _get_spatial_reference_from_proj4,
-    get_transform_shapely_geometry,
+    get_transform_shapely_geometries,
     normalize_proj4,
     LONGITUDE_LATITUDE_PROJ4)
 
@@ -58,27 +68,57 @@ def _get_source_name(url):
     return basename(split_url(url).path)
 
 
+def _get_vsicurl_path(source_path_or_url):
+    url = split_url(source_path_or_url)
+    if url.scheme not in ('http', 'https') or url.query:
+        return
+    if splitext(url.path)[1].lower() not in VSICURL_EXTENSIONS:
+        return
+    return '/vsicurl/' + source_path_or_url
+
+
 def _get_field_definitions(geotable):
     field_definitions = []
     for field_name in geotable.field_names:
-        dtype_name = geotable[field_name].dtype.name
-        if dtype_name in ('bool', 'int8', 'int16', 'int32'):
-            field_type = ogr.OFTInteger
-        elif dtype_name.startswith('int'):
-            field_type = ogr.OFTInteger64
-        elif dtype_name.startswith('float'):
-            field_type = ogr.OFTReal
-        elif dtype_name.startswith('date'):
-            field_type = ogr.OFTDate
-        elif dtype_name in ('object', 'category'):
-            field_type = ogr.OFTString
+        dtype = geotable[field_name].dtype
+        dtype_kind = dtype.kind
+        # Skip nullable extension dtypes such as Int64, which share numpy kinds
+        if not isinstance(dtype, (
+                np.dtype, CategoricalDtype, DatetimeTZDtype)):
+            dtype_kind = None
+        if dtype_kind == 'i':
+            field_type = (
+                ogr.OFTInteger if dtype.itemsize <= 4 else ogr.OFTInteger64)
+        elif dtype_kind in FIELD_TYPE_BY_DTYPE_KIND:
+            field_type = FIELD_TYPE_BY_DTYPE_KIND[dtype_kind]
         else:
-            L.warning('dtype not supported (%s)' % dtype_name)
+            L.warning('dtype not supported (%s)' % dtype.name)
             field_type = ogr.OFTString
         field_definitions.append(ogr.FieldDefn(field_name, field_type))
     return field_definitions
 
 
+def _get_file_key(source_path):
+    file_stat_key = _get_file_stat_key(source_path)
+    if not file_stat_key:
+        return
+    # Include sidecars such as .prj and .proj4 that change how a file loads
+    sidecar_stat_keys = tuple(_get_file_stat_key(replace_file_extension(
+        source_path, x)) for x in SIDECAR_EXTENSIONS)
+    return abspath(source_path), file_stat_key, sidecar_stat_keys
+
+
+def _get_file_stat_key(source_path):
+    try:
+        file_stat = stat(source_path)
+    except (OSError, TypeError, ValueError):
+        return
+    # Skip folders because their times do not change with their contents
+    if not S_ISREG(file_stat.st_mode):
+        return
+    return file_stat.st_mtime_ns, file_stat.st_size
+
+
 def _get_field_type_by_name(gdal_layer):
     field_type_by_name = OrderedDict()
     gdal_layer_definition = gdal_layer.GetLayerDefn()
@@ -91,77 +131,68 @@ def _get_field_type_by_name(gdal_layer):
 
 
 def _get_geometry_columns(table):
-    column_names = table.columns
-    for column_name in column_names:
+    # Classify each column once, ranking pairs by how specific their names are
+    x_column_by_rank, y_column_by_rank = {}, {}
+    for column_name in table.columns:
         normalized_column_name = _normalize_column_name(column_name)
-        if normalized_column_name == 'wkt':
-            return [column_name]
-        if normalized_column_name == 'longitudelatitudewkt':
+        if normalized_column_name in WKT_COLUMN_NAMES:
             return [column_name]
-        if normalized_column_name == 'latitudelongitudewkt':
-            return [column_name]
-
-    paired_columns = _get_paired_columns(
-        column_names, lambda _: _ == 'longitude', lambda _: _ == 'latitude')
-    if paired_columns:
-        return paired_columns
-
-    paired_columns = _get_paired_columns(
-        column_names,
-        lambda _: _.endswith('longitude'),
-        lambda _: _.endswith('latitude'))
-    if paired_columns:
-        return paired_columns
-
-    paired_columns = _get_paired_columns(
-        column_names, lambda _: _ == 'lon', lambda _: _ == 'lat')
-    if paired_columns:
-        return paired_columns
-
-    paired_columns = _get_paired_columns(
-        column_names, lambda _: _ == 'x', lambda _: _ == 'y')
-    if paired_columns:
-        return paired_columns
-
+        if normalized_column_name.endswith('longitude'):
+            if normalized_column_name == 'longitude':
+                x_column_by_rank[0] = column_name
+            x_column_by_rank[1] = column_name
+        elif normalized_column_name.endswith('latitude'):
+            if normalized_column_name == 'latitude':
+                y_column_by_rank[0] = column_name
+            y_column_by_rank[1] = column_name
+        elif normalized_column_name in PAIRED_COLUMN_RANK_BY_NAME:
+            rank, is_x = PAIRED_COLUMN_RANK_BY_NAME[normalized_column_name]
+            column_by_rank = x_column_by_rank if is_x else y_column_by_rank
+            column_by_rank[rank] = column_name
+    for rank in range(4):
+        if rank in x_column_by_rank and rank in y_column_by_rank:
+            return [x_column_by_rank[rank], y_column_by_rank[rank]]
     raise GeoTableError('geometry columns expected')
 
 
-def _get_paired_columns(column_names, is_x, is_y):
-    x_column, y_column = None, None
-    for column_name in column_names:
-        normalized_column_name = _normalize_column_name(column_name)
-        if is_x(normalized_column_name):
-            x_column = column_name
-        elif is_y(normalized_column_name):
-            y_column = column_name
-    if x_column and y_column:
-        return [x_column, y_column]
-
-
 def _get_get_field_values(field_type_by_name):
-    field_types = field_type_by_name.values()
+    # Resolve getters and converters once instead of for every feature
+    field_packs = [(
+        methodcaller(METHOD_NAME_BY_TYPE.get(
+            field_type, 'GetField'), field_index),
+        TRANSFORM_FIELD_VALUE_BY_TYPE.get(field_type, lambda x: x),
+    ) for field_index, field_type in enumerate(field_type_by_name.values())]
 
     def get_field_values(feature):
-        field_values = []
-        for field_index, field_type in enumerate(field_types):
-            try:
-                method_name = METHOD_NAME_BY_TYPE[field_type]
-            except KeyError:
-                method_name = 'GetField'
-            field_value = getattr(feature, method_name)(field_index)
-            field_values.append(_transform_field_value(
-                field_value, field_type))
-        return tuple(field_values)
+        return tuple(transform(get(feature)) for get, transform in field_packs)
 
     return get_field_values
 
 
-def _get_instance_for_csv(instance, source_proj4, target_proj4):
-    transform_shapely_geometry = get_transform_shapely_geometry(
-        source_proj4, target_proj4)
-    instance = instance.copy()
-    geometries = [transform_shapely_geometry(
-        g) for g in instance.pop('geometry_object')]
+def _get_groups(t, column_name):
+    # Skip grouping and its per-group copies when there is only one value
+    values = t[column_name].unique()
+    if len(values) == 1 and not isnull(values[0]):
+        return [(values[0], t)]
+    return t.groupby(column_name, sort=False)
+
+
+def _get_instance_for_csv(instance, target_proj4):
+    geometries = [None] * len(instance)
+    geometry_proj4s = [None] * len(instance)
+    geometry_objects = instance['geometry_object'].values
+    indices_by_proj4 = instance.groupby('geometry_proj4', sort=False).indices
+    for source_proj4, indices in indices_by_proj4.items():
+        source_proj4 = source_proj4 or LONGITUDE_LATITUDE_PROJ4
+        transform_shapely_geometries = get_transform_shapely_geometries(
+            source_proj4, target_proj4)
+        geometry_proj4 = normalize_proj4(target_proj4 or source_proj4)
+        for index, geometry in zip(indices, transform_shapely_geometries(
+                geometry_objects[indices])):
+            geometries[index] = geometry
+            geometry_proj4s[index] = geometry_proj4
+    instance = instance.drop(['geometry_object'], axis=1).reset_index(
+        drop=True)
 
     for column_name in instance.columns:
         normalized_column_name = _normalize_column_name(column_name)
@@ -172,25 +203,61 @@ def _get_instance_for_csv(instance, source_proj4, target_proj4):
         if normalized_column_name == 'longitudelatitudewkt':
             break
         if normalized_column_name == 'latitudelongitudewkt':
-            geometries = transform_geometries(geometries, flip_xy)
+            geometries = _flip_geometries(geometries)
             break
     else:
         column_name = 'wkt'
 
-    instance[column_name] = [g.wkt for g in geometries]
-    instance['geometry_proj4'] = normalize_proj4(
-        target_proj4 or source_proj4)
+    instance[column_name] = _get_geometry_wkts(geometries)
+    instance['geometry_proj4'] = geometry_proj4s
     return instance
 
 
-def _get_instance_from_gdal_layer(Class, gdal_layer, transform_gdal_geometry):
-    rows = []
+def _get_geometry_wkbs(geometries):
+    wkb_writer = WKBWriter(lgeos)
+    return [wkb_writer.write(g) for g in geometries]
+
+
+def _get_geometry_wkts(geometries):
+    wkt_writer = WKTWriter(lgeos)
+    return [wkt_writer.write(g) for g in geometries]
+
+
+def _flip_geometries(geometries):
+    # Swap whole coordinate sequences instead of one coordinate at a time
+    flipped_geometries = []
+    for geometry_object in geometries:
+        geometry_type = geometry_object.geom_type
+        if geometry_type == 'Point' and not geometry_object.is_empty:
+            flipped_geometry = geometry.Point(flip_xy(
+                geometry_object.coords[0]))
+        else:
+            flipped_geometry = ops.transform(
+                _flip_xy_sequences, geometry_object)
+        flipped_geometries.append(flipped_geometry)
+    return flipped_geometries
+
+
+def _flip_xy_sequences(*xyz):
+    return (xyz[1], xyz[0]) + xyz[2:]
+
+
+def _get_instance_from_gdal_layer(
+        Class, gdal_layer, transform_gdal_geometry, feature_count=None):
     field_type_by_name = _get_field_type_by_name(gdal_layer)
     get_field_values = _get_get_field_values(field_type_by_name)
-    feature_count = gdal_layer.GetFeatureCount()
-    for feature_index in range(feature_count):
+    field_names = list(field_type_by_name.keys())
+    field_columns = [[] for _ in field_names]
+    geometry_objects = []
+    wkb_reader = WKBReader(lgeos)
+    # Read to the end of the layer unless asked for a number of features
+    feature_indices = count() if feature_count is None else range(
+        feature_count)
+    for feature_index in feature_indices:
         feature = gdal_layer.GetNextFeature()
         if feature is None:
+            if feature_count is None:
+                break
             L.warning('feature unreadable (index=%s)' % feature_index)
             continue
         gdal_geometry = feature.GetGeometryRef()
@@ -198,52 +265,80 @@ def _get_instance_from_gdal_layer(Class, gdal_layer, transform_gdal_geometry):
             if gdal_geometry:
                 geometry_wkb = transform_gdal_geometry(
                     gdal_geometry).ExportToWkb()
-                shapely_geometry = wkb.loads(bytes(geometry_wkb))
+                shapely_geometry = wkb_reader.read(bytes(geometry_wkb))
             else:
                 shapely_geometry = None
         except WKBReadingError:
             L.warning('feature unloadable (index=%s)' % feature_index)
             continue
         field_values = get_field_values(feature)
-        rows.append(field_values + (shapely_geometry,))
-    field_names = tuple(field_type_by_name.keys())
-    return Class(rows, columns=field_names + ('geometry_object',))
+        for field_column, field_value in zip(field_columns, field_values):
+            field_column.append(field_value)
+        geometry_objects.append(shapely_geometry)
+    if not geometry_objects:
+        return Class(columns=field_names + ['geometry_object'])
+    column_by_name = OrderedDict(zip(field_names, field_columns))
+    column_by_name['geometry_object'] = geometry_objects
+    return Class(column_by_name)
 
 
 def _get_proj4_from_path(source_path, default_proj4):
     proj4_path = replace_file_extension(source_path, '.proj4')
     if not exists(proj4_path):
         return default_proj4 or LONGITUDE_LATITUDE_PROJ4
-    return normalize_proj4(open(proj4_path).read())
+    with open(proj4_path) as proj4_file:
+        proj4 = proj4_file.read()
+    return normalize_proj4(proj4)
 
 
-def _get_load_geometry_object(geometry_columns):
+def _get_load_geometry_objects(geometry_columns):
     if len(geometry_columns) == 2:
-        return lambda row: geometry.Point(*list(row[geometry_columns]))
+        x_column, y_column = geometry_columns
 
-    def load_geometry_object(row):
-        [geometry_wkt] = row[geometry_columns]
-        try:
-            geometry_object = wkt.loads(geometry_wkt)
-        except WKTReadingError:
-            raise GeoTableError('wkt unparseable (%s)' % geometry_wkt)
-        return geometry_object
+        def load_point_objects(t):
+            return [geometry.Point(x, y) for x, y in zip(
+                t[x_column].values, t[y_column].values)]
+
+        return load_point_objects
 
     column_name = _normalize_column_name(geometry_columns[0])
     if column_name in ('wkt', 'longitudelatitudewkt'):
-        return load_geometry_object
+
+        def load_geometry_objects(t):
+            return _load_geometry_objects_from_wkts(
+                t[geometry_columns[0]].values)
+
+        return load_geometry_objects
     elif column_name == 'latitudelongitudewkt':
 
-        def load_flipped_geometry_object(row):
-            geometry_object = load_geometry_object(row)
-            return transform_geometries([geometry_object], flip_xy)[0]
+        def load_flipped_geometry_objects(t):
+            geometry_objects = _load_geometry_objects_from_wkts(
+                t[geometry_columns[0]].values)
+            return _flip_geometries(geometry_objects)
 
-        return load_flipped_geometry_object
+        return load_flipped_geometry_objects
     else:
         raise GeoTableError(
             'geometry columns not supported (%s)' % ' '.join(geometry_columns))
 
 
+def _load_geometry_objects_from_wkts(geometry_wkts):
+    wkt_reader = WKTReader(lgeos)
+    geometry_objects = []
+    for geometry_wkt in geometry_wkts:
+        # Build two-dimensional points without going through the parser
+        try:
+            x, y = POINT_WKT_PATTERN.match(geometry_wkt).groups()
+            geometry_object = geometry.Point(float(x), float(y))
+        except (AttributeError, TypeError, ValueError):
+            try:
+                geometry_object = wkt_reader.read(geometry_wkt)
+            except WKTReadingError:
+                raise GeoTableError('wkt unparseable (%s)' % geometry_wkt)
+        geometry_objects.append(geometry_object)
+    return geometry_objects
+
+
 def _get_proj4_from_gdal_layer(gdal_layer, default_proj4=None):
     spatial_reference = gdal_layer.GetSpatialRef()
     try:
@@ -253,6 +348,10 @@ def _get_proj4_from_gdal_layer(gdal_layer, default_proj4=None):
     return normalize_proj4(proj4)
 
 
+def _has_geotable_columns(t):
+    return all(x in t.columns for x in GEOTABLE_COLUMN_NAMES)
+
+
 def _has_one_proj4(t):
     if len(t) < 1:
         return False
@@ -267,68 +366,94 @@ def _normalize_column_name(x):
 
 def _prepare_gdal_layer(t, gdal_dataset, target_proj4, layer_name):
     # Drop columns that have no values
-    t = t.dropna(axis=1, how='all').copy()
+    t = _drop_columns(t, [x for x in t.columns if t[x].isna().all()])
     # Coerce objects into strings to prevent errors
-    for field_name in t.field_names:
-        column = t[field_name]
-        if column.dtype.name == 'object':
-            t[field_name] = column.fillna('').astype(str)
+    object_field_names = [
+        x for x in t.field_names if t[x].dtype.name == 'object']
+    if object_field_names:
+        t[object_field_names] = t[object_field_names].fillna('').astype(str)
     # Create layer
-    layer_proj4 = target_proj4 or t.iloc[0]['geometry_proj4']
+    layer_proj4 = target_proj4 or t['geometry_proj4'].iat[0]
     gdal_layer = gdal_dataset.CreateLayer(
-        layer_name, _get_spatial_reference_from_proj4(layer_proj4))
+        layer_name, _get_spatial_reference_from_proj4(layer_proj4).Clone())
     for field_definition in _get_field_definitions(t):
         gdal_layer.CreateField(field_definition)
     layer_definition = gdal_layer.GetLayerDefn()
     # Add features
-    for source_proj4, proj4_t in t.groupby('geometry_proj4'):
-        f = get_transform_shapely_geometry(source_proj4, layer_proj4)
-        for index, row in proj4_t.iterrows():
-            ogr_feature = ogr.Feature(layer_definition)
-            for field_index, field_name in enumerate(t.field_names):
-                ogr_feature.SetField2(field_index, row[field_name])
-            ogr_feature.SetGeometry(ogr.CreateGeometryFromWkb(
-                f(row['geometry_object']).wkb))
+    field_names = t.field_names
+    # Reuse one feature and clear each field before setting it
+    ogr_feature = ogr.Feature(layer_definition)
+    # Batch writes in one transaction for drivers that support it
+    gdal_layer.StartTransaction()
+    for source_proj4, proj4_t in _get_groups(t, 'geometry_proj4'):
+        load_gdal_geometries = _get_load_gdal_geometries(
+            source_proj4, layer_proj4)
+        gdal_geometries = load_gdal_geometries(
+            proj4_t['geometry_object'].values)
+        # Yield empty rows explicitly because itertuples needs a column
+        field_rows = proj4_t[field_names].itertuples(
+            index=False, name=None) if field_names else repeat(
+                (), len(proj4_t))
+        for values, gdal_geometry in zip(field_rows, gdal_geometries):
+            for field_index, field_value in enumerate(values):
+                ogr_feature.SetFieldNull(field_index)
+                ogr_feature.SetField2(field_index, field_value)
+            ogr_feature.SetGeometryDirectly(gdal_geometry)
             try:
                 gdal_layer.CreateFeature(ogr_feature)
             except RuntimeError:
+                gdal_layer.RollbackTransaction()
                 raise GeoTableError(
                     'mutually incompatible geometry types '
                     'must be in separate layers')
+            # Let the layer assign a new id to the next feature
+            ogr_feature.SetFID(-1)
+    gdal_layer.CommitTransaction()
     return gdal_layer
 
 
 def _transform_field_value(field_value, field_type):
-    if field_type in (ogr.OFTInteger, ogr.OFTInteger64):
-        field_value = int(field_value)
-    elif field_type in (ogr.OFTIntegerList, ogr.OFTInteger64List):
-        field_value = [int(x) for x in field_value]
-    elif field_type in (ogr.OFTString, ogr.OFTWideString):
-        field_value = unicode_safely(field_value)
-    elif field_type in (ogr.OFTStringList, ogr.OFTWideStringList):
-        field_value = [unicode_safely(x) for x in field_value]
-    elif field_type in (ogr.OFTDate, ogr.OFTDateTime):
-        try:
-            field_value = datetime(*map(int, field_value))
-        except (OverflowError, ValueError):
-            pass
-    return field_value
+    try:
+        transform_field_value = TRANSFORM_FIELD_VALUE_BY_TYPE[field_type]
+    except KeyError:
+        return field_value
+    return transform_field_value(field_value)
+
+
+def _transform_datetime_value(field_value):
+    try:
+        return datetime(*map(int, field_value))
+    except (OverflowError, ValueError):
+        return field_value
+
+
+def _transform_integer_values(field_values):
+    return [int(x) for x in field_values]
+
+
+def _transform_string_values(field_values):
+    return [unicode_safely(x) for x in field_values]
+
+
+def _drop_columns(t, column_names):
+    # Return an owned frame so that callers can assign columns to it
+    return t.drop([x for x in column_names if x in t.columns], axis=1)
 
 
 def _ensure_geotable_columns(f):
 
     @wraps(f)
     def wrapped_function(*args, **kw):
-        self = args[0].copy()
-        _make_geotable(self)
+        self = args[0]
         arguments = inspect.signature(f).bind(*args, **kw).arguments
-        try:
-            target_path = arguments['target_path']
-        except KeyError:
-            pass
-        else:
-            target_stem = unicode_safely(get_file_stem(target_path))
-            self['geometry_layer'].replace('', target_stem, inplace=True)
+        target_path = arguments.get('target_path')
+        # Copy only if there are columns to add or layer names to fill
+        if not _has_geotable_columns(self) or target_path and (
+                self['geometry_layer'] == '').any():
+            self = _make_geotable(self.copy())
+            if target_path:
+                target_stem = unicode_safely(get_file_stem(target_path))
+                self['geometry_layer'].replace('', target_stem, inplace=True)
         return f(self, *args[1:], **kw)
 
     return wrapped_function
@@ -346,13 +471,24 @@ def _make_geotable(t):
             t['geometry_object'] = ''
         else:
             geometry_columns = _get_geometry_columns(t)
-            load_geometry_object = _get_load_geometry_object(
+            load_geometry_objects = _get_load_geometry_objects(
                 geometry_columns)
-            t['geometry_object'] = t.apply(load_geometry_object, axis=1)
+            t['geometry_object'] = load_geometry_objects(t)
 
     return t
 
 
+FIELD_TYPE_BY_DTYPE_KIND = {
+    'b': ogr.OFTInteger,
+    'f': ogr.OFTReal,
+    'M': ogr.OFTDate,
+    'O': ogr.OFTString,
+}
+GEOTABLE_COLUMN_NAMES = ['geometry_object', 'geometry_layer', 'geometry_proj4']
+PAIRED_COLUMN_RANK_BY_NAME = {
+    'lon': (2, True), 'lat': (2, False), 'x': (3, True), 'y': (3, False)}
+POINT_WKT_PATTERN = re.compile(
+    r'POINT\s*\(\s*([-+.0-9eE]+)\s+([-+.0-9eE]+)\s*\)\s*$')
 METHOD_NAME_BY_TYPE = {
     ogr.OFTBinary: 'GetFieldAsBinary',
     ogr.OFTDate: 'GetFieldAsDateTime',
@@ -369,3 +505,19 @@ METHOD_NAME_BY_TYPE = {
     ogr.OFTWideString: 'GetFieldAsString',
     ogr.OFTWideStringList: 'GetFieldAsStringList',
 }
+TRANSFORM_FIELD_VALUE_BY_TYPE = {
+    ogr.OFTDate: _transform_datetime_value,
+    ogr.OFTDateTime: _transform_datetime_value,
+    ogr.OFTInteger: int,
+    ogr.OFTIntegerList: _transform_integer_values,
+    ogr.OFTInteger64: int,
+    ogr.OFTInteger64List: _transform_integer_values,
+    ogr.OFTString: unicode_safely,
+    ogr.OFTStringList: _transform_string_values,
+    ogr.OFTWideString: unicode_safely,
+    ogr.OFTWideStringList: _transform_string_values,
+}
+SIDECAR_EXTENSIONS = ['.cpg', '.dbf', '.prj', '.proj4', '.shx']
+VSICURL_EXTENSIONS = frozenset(['.geojson', '.json', '.kml', '.kmz'])
+WKT_COLUMN_NAMES = frozenset([
+    'wkt', 'longitudelatitudewkt', 'latitudelongitudewkt'])
@@ -1,9 +1,13 @@
+from functools import lru_cache
+from math import isfinite
 from osgeo import ogr, osr
-from shapely import wkb
+from shapely.geometry import Point
+from shapely.geos import WKBReader, WKBWriter, lgeos
 
 from .exceptions import CoordinateTransformationError, SpatialReferenceError
 
 
+@lru_cache(maxsize=256)
 def get_proj4_from_epsg(epsg):
     spatial_reference = osr.SpatialReference()
     spatial_reference.ImportFromEPSG(epsg)
@@ -11,10 +15,10 @@ def get_proj4_from_epsg(epsg):
 
 
 def _get_transform_gdal_geometry(source_proj4, target_proj4):
-    if not target_proj4 or source_proj4 == target_proj4:
+    if not target_proj4 or is_same_proj4(source_proj4, target_proj4):
         return lambda x: x
     coordinate_transformation = _get_coordinate_transformation(
-        source_proj4, target_proj4)
+        normalize_proj4(source_proj4), normalize_proj4(target_proj4))
 
     def transform_gdal_geometry(gdal_geometry):
         try:
@@ -29,18 +33,80 @@ def _get_transform_gdal_geometry(source_proj4, target_proj4):
     return transform_gdal_geometry
 
 
+def _get_load_gdal_geometries(source_proj4, target_proj4):
+    if not target_proj4 or is_same_proj4(source_proj4, target_proj4):
+        return _make_gdal_geometries
+    transform_gdal_geometry = _get_transform_gdal_geometry(
+        source_proj4, target_proj4)
+    coordinate_transformation = _get_coordinate_transformation(
+        normalize_proj4(source_proj4), normalize_proj4(target_proj4))
+
+    def load_gdal_geometries(shapely_geometries):
+        shapely_geometries = list(shapely_geometries)
+        # Transform the batch in one call by wrapping it in a collection
+        gdal_collection = ogr.Geometry(ogr.wkbGeometryCollection)
+        for gdal_geometry in _make_gdal_geometries(shapely_geometries):
+            gdal_collection.AddGeometryDirectly(gdal_geometry)
+        try:
+            gdal_collection.Transform(coordinate_transformation)
+        except RuntimeError:
+            # Transform one at a time to report the failing geometry
+            return [transform_gdal_geometry(
+                x) for x in _make_gdal_geometries(shapely_geometries)]
+        gdal_geometries = []
+        for index, shapely_geometry in enumerate(shapely_geometries):
+            gdal_geometry = gdal_collection.GetGeometryRef(index).Clone()
+            # Restore 2D members because a collection has one dimension
+            if not shapely_geometry.has_z:
+                gdal_geometry.FlattenTo2D()
+            gdal_geometries.append(gdal_geometry)
+        return gdal_geometries
+
+    return load_gdal_geometries
+
+
 def get_transform_shapely_geometry(source_proj4, target_proj4):
+    if not target_proj4 or is_same_proj4(source_proj4, target_proj4):
+        return lambda x: x
     transform_gdal_geometry = _get_transform_gdal_geometry(
         source_proj4, target_proj4)
+    coordinate_transformation = _get_coordinate_transformation(
+        normalize_proj4(source_proj4), normalize_proj4(target_proj4))
+
+    wkb_reader, wkb_writer = WKBReader(lgeos), WKBWriter(lgeos)
 
     def transform_shapely_geometry(shapely_geometry):
-        gdal_geometry = ogr.CreateGeometryFromWkb(shapely_geometry.wkb)
+        shapely_points = _transform_shapely_points(
+            [shapely_geometry], coordinate_transformation)
+        if shapely_points is not None:
+            return shapely_points[0]
+        gdal_geometry = ogr.CreateGeometryFromWkb(wkb_writer.write(
+            shapely_geometry))
         geometry_wkb = transform_gdal_geometry(gdal_geometry).ExportToWkb()
-        return wkb.loads(bytes(geometry_wkb))
+        return wkb_reader.read(bytes(geometry_wkb))
 
     return transform_shapely_geometry
 
 
+def get_transform_shapely_geometries(source_proj4, target_proj4):
+    if not target_proj4 or is_same_proj4(source_proj4, target_proj4):
+        return list
+    transform_shapely_geometry = get_transform_shapely_geometry(
+        source_proj4, target_proj4)
+    coordinate_transformation = _get_coordinate_transformation(
+        normalize_proj4(source_proj4), normalize_proj4(target_proj4))
+
+    def transform_shapely_geometries(shapely_geometries):
+        shapely_geometries = list(shapely_geometries)
+        shapely_points = _transform_shapely_points(
+            shapely_geometries, coordinate_transformation)
+        if shapely_points is not None:
+            return shapely_points
+        return [transform_shapely_geometry(x) for x in shapely_geometries]
+
+    return transform_shapely_geometries
+
+
 def get_utm_proj4(zone_number, zone_letter):
     parts = []
     parts.extend([
@@ -56,11 +122,17 @@ def get_utm_proj4(zone_number, zone_letter):
     return ' '.join(parts)
 
 
+def is_same_proj4(proj4_a, proj4_b):
+    return normalize_proj4(proj4_a) == normalize_proj4(proj4_b)
+
+
+@lru_cache(maxsize=256)
 def normalize_proj4(proj4):
     spatial_reference = _get_spatial_reference_from_proj4(proj4)
     return spatial_reference.ExportToProj4().strip()
 
 
+@lru_cache(maxsize=512)
 def _get_coordinate_transformation(source_proj4, target_proj4):
     source_spatial_reference = _get_spatial_reference_from_proj4(source_proj4)
     target_spatial_reference = _get_spatial_reference_from_proj4(target_proj4)
@@ -77,6 +149,44 @@ def _get_coordinate_transformation(source_proj4, target_proj4):
     return coordinate_transformation
 
 
+def _make_gdal_geometries(shapely_geometries):
+    # Build points directly and serialize the rest through one writer
+    wkb_writer = WKBWriter(lgeos)
+    gdal_geometries = []
+    for shapely_geometry in shapely_geometries:
+        geometry_type = shapely_geometry.geom_type
+        if geometry_type == 'Point' and not shapely_geometry.is_empty:
+            xyz = shapely_geometry.coords[0]
+            gdal_geometry = ogr.Geometry(ogr.wkbPoint)
+            if len(xyz) == 2:
+                gdal_geometry.AddPoint_2D(*xyz)
+            else:
+                gdal_geometry.AddPoint(*xyz)
+        else:
+            gdal_geometry = ogr.CreateGeometryFromWkb(wkb_writer.write(
+                shapely_geometry))
+        gdal_geometries.append(gdal_geometry)
+    return gdal_geometries
+
+
+def _transform_shapely_points(shapely_geometries, coordinate_transformation):
+    # Transform coordinates in one call when every geometry is a point
+    if not shapely_geometries or not all(
+            g.geom_type == 'Point' and not g.is_empty
+            for g in shapely_geometries):
+        return
+    try:
+        xyzs = coordinate_transformation.TransformPoints([(
+            g.x, g.y, g.z if g.has_z else 0) for g in shapely_geometries])
+    except RuntimeError:
+        return
+    if not all(isfinite(x) and isfinite(y) for x, y, z in xyzs):
+        return
+    return [Point(x, y, z) if g.has_z else Point(x, y) for g, (
+        x, y, z) in zip(shapely_geometries, xyzs)]
+
+
+@lru_cache(maxsize=128)
 def _get_spatial_reference_from_proj4(proj4):
     spatial_reference = osr.SpatialReference()
     try:
@@ -3,16 +3,19 @@ from geotable import (
     ColorfulGeometryCollection,
     GeoRow,
     GeoTable,
+    concatenate_tables,
     define_load_with_utm_proj4,
     load,
     load_utm_proj4)
-from geotable.exceptions import EmptyGeoTableError, GeoTableError
+from geotable.exceptions import (
+    CoordinateTransformationError, EmptyGeoTableError, GeoTableError)
 from geotable.projections import (
     normalize_proj4, LONGITUDE_LATITUDE_PROJ4, SPHERICAL_MERCATOR_PROJ4)
 from invisibleroads_macros.disk import replace_file_extension, uncompress
 from os.path import exists, join
 from pytest import raises
 from shapely.geometry import Point, LineString, Polygon
+from shutil import copy
 
 from conftest import FOLDER
 
@@ -36,6 +39,14 @@ class TestGeoTable(object):
         assert load_utm_proj4(join(FOLDER, 'xyz.kmz')) == UTM_PROJ4
         assert GeoTable.load_utm_proj4(join(FOLDER, 'shp.zip')) == UTM_PROJ4
 
+    def test_load_utm_proj4_without_geometries(self, tmpdir):
+        source_path = str(tmpdir.join('x.csv'))
+        GeoTable.from_records([
+            ('POINT EMPTY',),
+        ], columns=['wkt']).save_csv(source_path)
+        with raises(GeoTableError):
+            load_utm_proj4(source_path)
+
     def test_load(self, tmpdir):
         t = load(join(FOLDER, 'xyz.kmz'))
         assert len(t.iloc[0]['geometry_object'].coords[0]) == 3
@@ -88,6 +99,27 @@ class TestGeoTable(object):
             '?method=export&format=Original')
         assert len(t) == 5
 
+    def test_load_without_vsicurl(self, mocker):
+        from_gdal = GeoTable.from_gdal
+
+        def load_without_vsicurl(source_path, *args):
+            if source_path.startswith('/vsicurl/'):
+                raise RuntimeError
+            return from_gdal(source_path, *args)
+
+        def retrieve(url, target_path):
+            copy(join(FOLDER, 'xyz.kmz'), target_path)
+
+        mocker.patch.object(
+            GeoTable, 'from_gdal', side_effect=load_without_vsicurl)
+        mocker.patch('geotable.macros.urlretrieve', side_effect=retrieve)
+        t = GeoTable.load('https://example.com/xyz.kmz')
+        assert len(t) == 3
+
+        GeoTable.from_gdal.side_effect = CoordinateTransformationError
+        with raises(CoordinateTransformationError):
+            GeoTable.load('https://example.com/xyz.kmz')
+
     def test_drop_duplicate_geometries(self):
         t = GeoTable.from_records([
             (0, 0),
@@ -101,6 +133,14 @@ class TestGeoTable(object):
         assert len(t.drop_duplicate_geometries(inplace=True)) == 3
         assert len(t) == 3
 
+        t = GeoTable.from_records([
+            (0, 0),
+            (0, 0),
+            (0, 1),
+        ], columns=['lon', 'lat'], index=[7, 7, 8])
+        t.drop_duplicate_geometries(inplace=True)
+        assert list(t.index) == [7, 8]
+
     def test_from_records(self):
         geometry = Point(0, 0)
 
@@ -120,6 +160,12 @@ class TestGeoTable(object):
             FOLDER, 'shp', 'b.shp'), target_proj4=UTM_PROJ4)
         assert int(t.iloc[0]['geometry_object'].x) == -638500
 
+    def test_iter_from_gdal(self):
+        ts = list(GeoTable.iter_from_gdal(
+            join(FOLDER, 'xyz.kmz'), chunk_size=2))
+        assert sum(len(t) for t in ts) == 3
+        assert max(len(t) for t in ts) == 2
+
     def test_from_csv(self, tmpdir):
         p = tmpdir.join('x.csv')
 
@@ -202,6 +248,17 @@ class TestGeoTable(object):
         t = GeoTable.load(target_path)
         assert len(t) == 0
 
+    def test_save_shp_with_missing_dates(self, tmpdir):
+        target_path = str(tmpdir.join('x.zip'))
+        GeoTable([
+            ('POINT (0 0)', pd.Timestamp(2000, 1, 1)),
+            ('POINT (1 1)', pd.NaT),
+        ], columns=['wkt', 'dt']).save_shp(target_path)
+
+        t = GeoTable.load(target_path)
+        assert t['dt'].iat[0] == pd.Timestamp(2000, 1, 1)
+        assert pd.isnull(t['dt'].iat[1])
+
     def test_save_csv(self, geotable, tmpdir):
         target_path = str(tmpdir.join('x.csv'))
         geotable.save_csv(target_path)
@@ -226,6 +283,12 @@ class TestGeoTable(object):
         with raises(GeoTableError):
             geotable.to_gdal(target_path, driver_name='x')
 
+    def test_save_without_chained_assignment(self, geotable, tmpdir):
+        assert geotable['float_nan'].isna().all()
+        with pd.option_context('mode.chained_assignment', 'raise'):
+            geotable.save_csv(str(tmpdir.join('x.csv')))
+            geotable.save_shp(str(tmpdir.join('x.zip')))
+
     def test_draw(self, geotable):
         svg = geotable.draw().svg()
         assert 'circle' in svg
@@ -241,6 +304,18 @@ class TestGeoTable(object):
         assert type(georow) == GeoRow
         assert georow['category'] == 'vegetable'
 
+    def test_concatenate_tables(self):
+        t = GeoTable.from_records([(0, 0), (1, 1)], columns=['x', 'y'])
+        t.index = [3, 5]
+        concatenated_t = concatenate_tables([t])
+        assert concatenated_t is not t
+        assert list(concatenated_t.index) == [0, 1]
+        assert list(t.index) == [3, 5]
+        concatenated_t = concatenate_tables([t], ignore_index=False)
+        assert concatenated_t is not t
+        assert list(concatenated_t.index) == [3, 5]
+        assert len(concatenate_tables([t, t])) == 4
+
 
 class TestGeoRow(object):
 
@@ -262,3 +337,8 @@ class TestColorfulGeometryCollection(object):
     def test_svg(self):
         assert ColorfulGeometryCollection().svg() == '<g />'
         assert 'circle' in ColorfulGeometryCollection([Point(0, 0)]).svg()
+
+        collection = ColorfulGeometryCollection([Point(0, 0)], ['#000000'])
+        assert collection.svg() == collection.svg()
+        collection.colors = ['#ffffff']
+        assert '#ffffff' in collection.svg()
@@ -3,21 +3,30 @@ from datetime import datetime
 from geotable import macros
 from geotable.exceptions import GeoTableError
 from geotable.macros import (
+    _flip_geometries,
+    _get_field_definitions,
+    _get_file_key,
     _get_geometry_columns,
+    _get_geometry_wkbs,
+    _get_geometry_wkts,
     _get_get_field_values,
+    _get_groups,
     _get_instance_for_csv,
     _get_instance_from_gdal_layer,
-    _get_load_geometry_object,
+    _get_load_geometry_objects,
     _get_proj4_from_gdal_layer,
     _get_source_folder,
+    _get_vsicurl_path,
     _has_one_proj4,
     _transform_field_value)
-from geotable.projections import LONGITUDE_LATITUDE_PROJ4
+from geotable.projections import (
+    LONGITUDE_LATITUDE_PROJ4, SPHERICAL_MERCATOR_PROJ4)
 from mock import MagicMock
+from os.path import join
 from osgeo import ogr
 from pytest import raises
 from shapely.errors import WKBReadingError
-from shapely.geometry import Point
+from shapely.geometry import LineString, Point
 
 from conftest import prepare_feature, FOLDER
 
@@ -27,6 +36,39 @@ def test_get_source_folder(tmpdir):
     assert _get_source_folder(FOLDER, temporary_folder, []) == FOLDER
 
 
+def test_flip_geometries():
+    geometries = _flip_geometries([
+        Point(0, 1), Point(0, 1, 2), Point(), LineString([(0, 1), (2, 3)])])
+    assert geometries[0].coords[0] == (1, 0)
+    assert geometries[1].coords[0] == (1, 0, 2)
+    assert geometries[2].is_empty
+    assert list(geometries[3].coords) == [(1, 0), (3, 2)]
+
+
+def test_get_field_definitions(geotable):
+    geotable['int_na'] = pd.array([None], dtype='Int64')
+    field_type_by_name = {
+        x.GetName(): x.GetType() for x in _get_field_definitions(geotable)}
+    assert field_type_by_name['int32'] == ogr.OFTInteger
+    assert field_type_by_name['int64'] == ogr.OFTInteger64
+    assert field_type_by_name['dt_tz'] == ogr.OFTDate
+    assert field_type_by_name['category'] == ogr.OFTString
+    assert field_type_by_name['int_na'] == ogr.OFTString
+
+
+def test_get_file_key(tmpdir):
+    source_path_object = tmpdir.join('x.csv')
+    source_path = str(source_path_object)
+    assert _get_file_key(source_path) is None
+    source_path_object.write('x,y\n0,0\n')
+    file_key = _get_file_key(source_path)
+    assert file_key[1][-1] == 8
+    tmpdir.join('x.proj4').write(SPHERICAL_MERCATOR_PROJ4)
+    assert _get_file_key(source_path) != file_key
+    assert _get_file_key(str(tmpdir)) is None
+    assert _get_file_key('https://example.com/x.csv') is None
+
+
 def test_get_geometry_columns():
     t = pd.DataFrame([('POINT(0 0)',)], columns=['WKT'])
     assert _get_geometry_columns(t) == ['WKT']
@@ -57,6 +99,20 @@ def test_get_geometry_columns():
     t = pd.DataFrame([(0, 0)], columns=['X', 'Y'])
     assert _get_geometry_columns(t) == ['X', 'Y']
 
+    t = pd.DataFrame([(0, 0, 0, 0, 0, 0)], columns=[
+        'X', 'Y', 'LON', 'LAT', 'PickupLongitude', 'Latitude'])
+    assert _get_geometry_columns(t) == ['PickupLongitude', 'Latitude']
+
+
+def test_get_geometry_wkbs():
+    geometries = [Point(0, 0), Point(1, 2, 3)]
+    assert _get_geometry_wkbs(geometries) == [g.wkb for g in geometries]
+
+
+def test_get_geometry_wkts():
+    geometries = [Point(0, 0), Point(1, 2)]
+    assert _get_geometry_wkts(geometries) == [g.wkt for g in geometries]
+
 
 def test_get_get_field_values():
     feature, field_type_by_name, field_values = prepare_feature([
@@ -85,26 +141,46 @@ def test_get_get_field_values():
     assert f(feature) == field_values
 
 
+def test_get_groups():
+    t = pd.DataFrame([(1, 'a'), (2, 'a')], columns=['x', 'y'])
+    [(value, group_t)] = _get_groups(t, 'y')
+    assert value == 'a'
+    assert group_t is t
+
+    t = pd.DataFrame([(1, 'a'), (2, 'b')], columns=['x', 'y'])
+    assert [value for value, _ in _get_groups(t, 'y')] == ['a', 'b']
+
+
 def test_get_instance_for_csv():
-    geotable_columns = ['geometry_object']
+    geotable_columns = ['geometry_object', 'geometry_proj4']
     t = _get_instance_for_csv(
         pd.DataFrame([], columns=geotable_columns + ['WKT']),
-        LONGITUDE_LATITUDE_PROJ4, LONGITUDE_LATITUDE_PROJ4)
+        LONGITUDE_LATITUDE_PROJ4)
     assert 'wkt' not in t.columns
     assert 'WKT' in t.columns
 
     t = _get_instance_for_csv(
         pd.DataFrame([], columns=geotable_columns + ['longitudelatitudewkt']),
-        LONGITUDE_LATITUDE_PROJ4, LONGITUDE_LATITUDE_PROJ4)
+        LONGITUDE_LATITUDE_PROJ4)
     assert 'wkt' not in t.columns
     assert 'longitudelatitudewkt' in t.columns
 
     t = _get_instance_for_csv(
         pd.DataFrame([], columns=geotable_columns + ['latitudelongitudewkt']),
-        LONGITUDE_LATITUDE_PROJ4, LONGITUDE_LATITUDE_PROJ4)
+        LONGITUDE_LATITUDE_PROJ4)
     assert 'wkt' not in t.columns
     assert 'latitudelongitudewkt' in t.columns
 
+    source_t = pd.DataFrame([
+        (Point(1, 2), LONGITUDE_LATITUDE_PROJ4, 'POINT (0 0)'),
+    ], index=[5], columns=geotable_columns + ['wkt'])
+    t = _get_instance_for_csv(source_t, None)
+    assert list(t.index) == [0]
+    assert t.iloc[0]['wkt'] == 'POINT (1 2)'
+    assert t.iloc[0]['geometry_proj4'] == LONGITUDE_LATITUDE_PROJ4
+    assert list(source_t.index) == [5]
+    assert source_t.iloc[0]['wkt'] == 'POINT (0 0)'
+
 
 def test_get_instance_from_gdal_layer(mocker):
     f = mocker.patch.object(macros, '_get_field_type_by_name')
@@ -113,7 +189,6 @@ def test_get_instance_from_gdal_layer(mocker):
     f.return_value = lambda x: []
     mock_class = MagicMock()
     mock_gdal_layer = MagicMock()
-    mock_gdal_layer.GetFeatureCount.return_value = 1
     mock_gdal_layer.GetNextFeature.return_value = None
     mock_transform_gdal_geometry = MagicMock()
     t = _get_instance_from_gdal_layer(
@@ -125,28 +200,33 @@ def test_get_instance_from_gdal_layer(mocker):
     mock_feature = MagicMock()
     mock_gdal_layer.GetNextFeature.return_value = mock_feature
     t = _get_instance_from_gdal_layer(
-        mock_class, mock_gdal_layer, mock_transform_gdal_geometry)
+        mock_class, mock_gdal_layer, mock_transform_gdal_geometry, 1)
     assert not len(t.geometries)
 
 
-def test_get_load_geometry_object():
-    f = _get_load_geometry_object(['x', 'y'])
-    f(pd.Series({'x': 1, 'y': 2})) == Point(1, 2)
+def test_get_load_geometry_objects():
+    f = _get_load_geometry_objects(['x', 'y'])
+    assert f(pd.DataFrame([(1, 2)], columns=['x', 'y'])) == [Point(1, 2)]
 
-    f = _get_load_geometry_object(['LongitudeLatitudeWkt'])
-    f(pd.Series({'LongitudeLatitudeWkt': 'POINT (1 2)'})) == Point(1, 2)
+    f = _get_load_geometry_objects(['wkt'])
+    assert f(pd.DataFrame([('POINT (1 2)',)], columns=['wkt'])) == [
+        Point(1, 2)]
 
-    f = _get_load_geometry_object(['longitude_latitude_wkt'])
-    f(pd.Series({'longitude_latitude_wkt': 'POINT (1 2)'})) == Point(1, 2)
+    f = _get_load_geometry_objects(['latitude_longitude_wkt'])
+    assert f(pd.DataFrame([('POINT (2 1)',)], columns=[
+        'latitude_longitude_wkt'])) == [Point(1, 2)]
 
-    f = _get_load_geometry_object(['LatitudeLongitudeWkt'])
-    f(pd.Series({'LatitudeLongitudeWkt': 'POINT (2 1)'})) == Point(1, 2)
-
-    f = _get_load_geometry_object(['latitude_longitude_wkt'])
-    f(pd.Series({'latitude_longitude_wkt': 'POINT (2 1)'})) == Point(1, 2)
+    f = _get_load_geometry_objects(['wkt'])
+    assert f(pd.DataFrame([
+        ('POINT(1.5 -2e1)',), ('POINT Z (1 2 3)',),
+    ], columns=['wkt'])) == [Point(1.5, -20), Point(1, 2, 3)]
+    with raises(GeoTableError):
+        f(pd.DataFrame([('x',)], columns=['wkt']))
+    with raises(GeoTableError):
+        f(pd.DataFrame([('POINT (1 .)',)], columns=['wkt']))
 
     with raises(GeoTableError):
-        _get_load_geometry_object(['x'])
+        _get_load_geometry_objects(['x'])
 
 
 def test_get_proj4_from_gdal_layer(mocker):
@@ -156,6 +236,14 @@ def test_get_proj4_from_gdal_layer(mocker):
         mock_gdal_layer) == LONGITUDE_LATITUDE_PROJ4
 
 
+def test_get_vsicurl_path():
+    assert _get_vsicurl_path('https://example.com/x.geojson') == (
+        '/vsicurl/https://example.com/x.geojson')
+    assert _get_vsicurl_path('https://example.com/x.geojson?y=1') is None
+    assert _get_vsicurl_path('https://example.com/x.zip') is None
+    assert _get_vsicurl_path(join(FOLDER, 'x.geojson')) is None
+
+
 def test_has_one_proj4():
     assert _has_one_proj4(pd.DataFrame()) is False
 
@@ -1,11 +1,13 @@
 from geotable.exceptions import (
     CoordinateTransformationError, SpatialReferenceError)
 from geotable.projections import (
-    _get_spatial_reference_from_proj4, _get_transform_gdal_geometry,
-    get_proj4_from_epsg, get_utm_proj4, LONGITUDE_LATITUDE_PROJ4,
-    SPHERICAL_MERCATOR_PROJ4)
+    _get_load_gdal_geometries, _get_spatial_reference_from_proj4,
+    _get_transform_gdal_geometry,
+    get_proj4_from_epsg, get_transform_shapely_geometries, get_utm_proj4,
+    is_same_proj4, LONGITUDE_LATITUDE_PROJ4, SPHERICAL_MERCATOR_PROJ4)
 from osgeo import ogr
 from pytest import raises
+from shapely.geometry import LineString, Point
 
 
 def test_get_proj4_from_epsg():
@@ -18,12 +20,61 @@ def test_get_spatial_reference_from_proj4():
     _get_spatial_reference_from_proj4(LONGITUDE_LATITUDE_PROJ4)
 
 
+def test_get_load_gdal_geometries():
+    f = _get_load_gdal_geometries(
+        LONGITUDE_LATITUDE_PROJ4, SPHERICAL_MERCATOR_PROJ4)
+    gdal_geometries = f([Point(0, 0), Point(1, 1).buffer(1)])
+    assert gdal_geometries[0].GetX() == 0
+    assert gdal_geometries[1].GetGeometryName() == 'POLYGON'
+    with raises(CoordinateTransformationError):
+        f([Point(0, 0), Point(100, 100)])
+    gdal_geometries = f([
+        Point(0, 0), Point(1, 1, 1), LineString([(0, 0), (1, 1)]),
+        LineString([(0, 0, 1), (1, 1, 1)])])
+    assert [x.GetCoordinateDimension() for x in gdal_geometries] == [
+        2, 3, 2, 3]
+    assert gdal_geometries[1].GetZ() == 1
+    f = _get_load_gdal_geometries(LONGITUDE_LATITUDE_PROJ4, None)
+    gdal_geometries = f([Point(100, 100), Point(1, 2, 3)])
+    assert gdal_geometries[0].GetCoordinateDimension() == 2
+    assert gdal_geometries[1].GetZ() == 3
+
+
 def test_get_transform_gdal_geometry():
     f = _get_transform_gdal_geometry(
         LONGITUDE_LATITUDE_PROJ4, SPHERICAL_MERCATOR_PROJ4)
     with raises(CoordinateTransformationError):
         f(ogr.CreateGeometryFromWkt('POINT(100 100)'))
+    f = _get_transform_gdal_geometry(
+        LONGITUDE_LATITUDE_PROJ4, '+proj=longlat +datum=WGS84 +no_defs')
+    gdal_geometry = ogr.CreateGeometryFromWkt('POINT(100 100)')
+    assert f(gdal_geometry) is gdal_geometry
+
+
+def test_get_transform_shapely_geometries():
+    f = get_transform_shapely_geometries(
+        LONGITUDE_LATITUDE_PROJ4, SPHERICAL_MERCATOR_PROJ4)
+    geometries = f([Point(0, 0), Point(1, 1)])
+    assert len(geometries) == 2
+    assert geometries[0].x == 0
+    assert geometries[1].x > 1
+    with raises(CoordinateTransformationError):
+        f([Point(0, 0), Point(100, 100)])
+    geometries = f([Point(1, 1, 1), Point(0, 0).buffer(1)])
+    assert geometries[0].has_z
+    assert geometries[1].geom_type == 'Polygon'
+
+    f = get_transform_shapely_geometries(LONGITUDE_LATITUDE_PROJ4, None)
+    geometries = [Point(0, 0)]
+    assert f(geometries)[0] is geometries[0]
 
 
 def test_get_utm_proj4():
     assert '+south' in get_utm_proj4(22, 'M')
+
+
+def test_is_same_proj4():
+    assert is_same_proj4(
+        '+proj=longlat +datum=WGS84 +no_defs', LONGITUDE_LATITUDE_PROJ4)
+    assert not is_same_proj4(
+        LONGITUDE_LATITUDE_PROJ4, SPHERICAL_MERCATOR_PROJ4)